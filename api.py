@@ -1,7 +1,7 @@
 from fastapi import FastAPI
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict
-from pes_utils import compute_pes, suggest_adjustments
+from pes_utils import analyze
 
 
 
@@ -9,12 +9,12 @@ app = FastAPI(title="PES Advisor API")
 
 # Request model for manual PES analysis
 class ManualInput(BaseModel):
-    TirePressure_Front: float
-    TirePressure_Rear: float
-    TireSize_Front: float
-    TireSize_Rear: float
-    DriverWeight_kg: float
-    CoolantTemperature_C: float
+    TirePressure_Front: float = Field(ge=0)
+    TirePressure_Rear: float = Field(ge=0)
+    TireSize_Front: float = Field(gt=0)
+    TireSize_Rear: float = Field(gt=0)
+    DriverWeight_kg: float = Field(gt=0)
+    CoolantTemperature_C: float = Field(gt=0)
 
 # Response model
 class PESOutput(BaseModel):
@@ -23,12 +23,9 @@ class PESOutput(BaseModel):
 
 # Endpoint 1: Analyze custom input
 @app.post("/analyze", response_model=PESOutput)
-def analyze_manual_input(data: ManualInput):
-    row = data.dict()
-    row["PES"] = 0  # placeholder
-
-    pes = compute_pes(row)
-    suggestions = suggest_adjustments(row)
+async def analyze_manual_input(data: ManualInput):
+    # Pure arithmetic, so it runs on the event loop instead of the threadpool
+    pes, suggestions = analyze(data.model_dump())
 
     return PESOutput(
         estimated_pes=round(pes, 6),
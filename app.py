@@ -1,136 +1,294 @@
+import os
+import hashlib
 import streamlit as st
 import pandas as pd
+import numpy as np
 import uuid
 import re
-from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, OptimizersConfigDiff,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams, QuantizationSearchParams, Filter, HasIdCondition, HnswConfigDiff,
+    SearchRequest
+)
 import plotly.graph_objects as go
+from query_cache import QueryCache
+# compute_pes_batch lives in pes_utils so the compiled kernel survives Streamlit reruns
+from pes_utils import analyze, suggest_adjustments, compute_pes_batch
+
+st.set_page_config(page_title="PES Advisor", page_icon="🏍️")
 
 # === 1. Load CSV File ===
-df = pd.read_csv("lemans_200_data_with_pes.csv")
+CSV_PATH = "lemans_200_data_with_pes.csv"
+
+# The mtime/fingerprint arguments only key the caches, so an edited CSV is reloaded
+@st.cache_data(show_spinner=False)
+def csv_fingerprint(path, mtime):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@st.cache_data
+def load_df(fingerprint):
+    return pd.read_csv(CSV_PATH)
 
 # === 2. Embedding Model ===
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")  # 384-dim
+# "onnx" (default), "openvino" for Intel CPUs, or "torch" for the plain PyTorch graph
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # 384-dim
+QUANTIZED_MODEL_FILES = {
+    "onnx": "onnx/model_qint8_avx512_vnni.onnx",
+    "openvino": "openvino/openvino_model_qint8_quantized.xml",
+}
+
+@st.cache_resource
+def load_embedder():
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(os.cpu_count() or 4)
+    # Can only be set once per process; this loader reruns after a cache clear
+    if torch.get_num_interop_threads() != 1:
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    if EMBEDDING_BACKEND in QUANTIZED_MODEL_FILES:
+        return SentenceTransformer(
+            EMBEDDING_MODEL,  # INT8 quantized
+            backend=EMBEDDING_BACKEND,
+            model_kwargs={"file_name": QUANTIZED_MODEL_FILES[EMBEDDING_BACKEND]}
+        )
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+embedding_model = load_embedder()
 
 def get_embedding(text):
-    return embedding_model.encode(text, convert_to_numpy=True).tolist()
+    # Accepts a single string or a list of strings; returns float32 arrays,
+    # which qdrant_client takes directly without a Python list round trip
+    if EMBEDDING_BACKEND == "torch":
+        import torch  # already loaded by load_embedder
+
+        with torch.inference_mode():
+            return encode(text)
+    return encode(text)
+
+def encode(text):
+    return embedding_model.encode(
+        text, convert_to_numpy=True, normalize_embeddings=True,
+        batch_size=64, show_progress_bar=False
+    ).astype(np.float32, copy=False)
+
+# Streamlit re-executes this script on every interaction, so a module-level
+# functools.lru_cache would be rebuilt each rerun; st.cache_data persists.
+@st.cache_data(max_entries=2048, show_spinner=False)
+def get_query_embedding(text):
+    return get_embedding(text)
+
+@st.cache_resource
+def get_query_cache():
+    return QueryCache(max_size=1000, ttl=300)
+
+query_cache = get_query_cache()
 
 # === 3. Qdrant Setup ===
-qdrant = QdrantClient(
-    host="localhost",
-    port=6333
-)
+@st.cache_resource
+def get_qdrant():
+    # gRPC (6334) for searches and uploads; REST (6333) stays available as fallback
+    return QdrantClient(
+        host="localhost",
+        port=6333,
+        grpc_port=6334,
+        prefer_grpc=True
+    )
+
+qdrant = get_qdrant()
 
 collection_name = "lemans_data"
+DEFAULT_INDEXING_THRESHOLD = 20000  # Qdrant default, in KB
+NUMERIC_FIELDS = [
+    "TirePressure_Front", "TirePressure_Rear", "TireSize_Front", "TireSize_Rear",
+    "DriverWeight_kg", "CoolantTemperature_C", "PES"
+]
+
+# The sentinel point records the fingerprint of the CSV and encoder behind the
+# last complete ingest. It is written last, so a partial upload is redone.
+SENTINEL_ID = 0
+SENTINEL_VECTOR = [1.0] + [0.0] * 383
+NOT_SENTINEL = Filter(must_not=[HasIdCondition(has_id=[SENTINEL_ID])])
+
+def row_to_text(row):
+    # row is a namedtuple from DataFrame.itertuples
+    return (
+        f"Tire Pressure Front: {row.TirePressure_Front} bar, "
+        f"Tire Pressure Rear: {row.TirePressure_Rear} bar, "
+        f"Tire Size Front: {row.TireSize_Front}, "
+        f"Tire Size Rear: {row.TireSize_Rear}, "
+        f"Driver Weight: {row.DriverWeight_kg} kg, "
+        f"Coolant Temperature: {row.CoolantTemperature_C} °C, "
+        f"Coolant Type: {row.CoolantType}, "
+        f"PES: {row.PES}"
+    )
+
+def ingest_fingerprint(csv_hash):
+    # Stored vectors depend on the encoder too, so switching backends reingests
+    model_file = QUANTIZED_MODEL_FILES.get(EMBEDDING_BACKEND, "pytorch")
+    key = f"{csv_hash}|{EMBEDDING_MODEL}|{EMBEDDING_BACKEND}|{model_file}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def ingested_fingerprint():
+    if not qdrant.collection_exists(collection_name):
+        return None
+    sentinel = qdrant.retrieve(collection_name=collection_name, ids=[SENTINEL_ID], with_payload=True)
+    return sentinel[0].payload.get("fingerprint") if sentinel else None
+
+def ingest(df, fingerprint):
+    if qdrant.collection_exists(collection_name):
+        qdrant.delete_collection(collection_name)
 
-if not qdrant.collection_exists(collection_name):
     qdrant.create_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+        vectors_config=VectorParams(size=384, distance=Distance.COSINE),
+        # m=8 is plenty for a few hundred rows; past ~100k vectors set on_disk=True
+        # and rely on the in-RAM quantized vectors instead
+        hnsw_config=HnswConfigDiff(m=8, ef_construct=64, full_scan_threshold=10000, on_disk=False),
+        # Skip HNSW indexing during the bulk upload; re-enabled below
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+        # INT8 copies stay in RAM; originals are used to rescore the top hits
+        quantization_config=ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+        )
     )
 
-    def row_to_text(row):
-        return (
-            f"Tire Pressure Front: {row['TirePressure_Front']} bar, "
-            f"Tire Pressure Rear: {row['TirePressure_Rear']} bar, "
-            f"Tire Size Front: {row['TireSize_Front']}, "
-            f"Tire Size Rear: {row['TireSize_Rear']}, "
-            f"Driver Weight: {row['DriverWeight_kg']} kg, "
-            f"Coolant Temperature: {row['CoolantTemperature_C']} °C, "
-            f"Coolant Type: {row['CoolantType']}, "
-            f"PES: {row['PES']}"
-        )
+    # Encode all rows in one call; SBERT sorts the batch by length internally
+    # and restores the original order, so padding stays minimal.
+    texts = [row_to_text(row) for row in df.itertuples(index=False)]
+    vectors = get_embedding(texts)
+
+    # Store the numeric fields with the text so search hits need no parsing;
+    # tire sizes such as "30/71-R18" keep their leading width.
+    numeric = df[NUMERIC_FIELDS].copy()
+    for col in ("TireSize_Front", "TireSize_Rear"):
+        numeric[col] = df[col].astype(str).str.extract(r"([\d.]+)", expand=False)
+    numeric = numeric.astype(float)
+    rows = numeric.to_dict("records")
+    pes_values = compute_pes_batch(numeric)
+
+    qdrant.upload_collection(
+        collection_name=collection_name,
+        vectors=vectors,
+        payload=[
+            {"text": text, "row": row, "pes": float(pes)}
+            for text, row, pes in zip(texts, rows, pes_values)
+        ],
+        ids=[str(uuid.uuid4()) for _ in texts],
+        batch_size=64,
+        parallel=2,
+        wait=False
+    )
+    qdrant.upsert(
+        collection_name=collection_name,
+        points=[PointStruct(id=SENTINEL_ID, vector=SENTINEL_VECTOR, payload={"fingerprint": fingerprint})],
+        wait=True
+    )
+    qdrant.update_collection(
+        collection_name=collection_name,
+        optimizer_config=OptimizersConfigDiff(indexing_threshold=DEFAULT_INDEXING_THRESHOLD)
+    )
+    query_cache.invalidate()
+
+@st.cache_resource(show_spinner="Indexing telemetry data...")
+def ensure_collection(csv_hash):
+    # Runs once per CSV version; the DataFrame is only read when reingesting
+    fingerprint = ingest_fingerprint(csv_hash)
+    if ingested_fingerprint() != fingerprint:
+        ingest(load_df(csv_hash), fingerprint)
 
-    points = []
-    for _, row in df.iterrows():
-        text = row_to_text(row)
-        vector = get_embedding(text)
-        points.append(PointStruct(id=str(uuid.uuid4()), vector=vector, payload={"text": text}))
-    qdrant.upsert(collection_name=collection_name, points=points)
+ensure_collection(csv_fingerprint(CSV_PATH, os.path.getmtime(CSV_PATH)))
 
 # === 4. Utility Functions ===
+_SAFE_RE = re.compile(r"[^\w\s\-.,?]")
+# Oversample the INT8 candidates and rescore them with the original vectors
+SEARCH_PARAMS = SearchParams(
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
 def sanitize_input(text):
-    return re.sub(r"[^\w\s\-.,?]", "", text)[:300]
+    return _SAFE_RE.sub("", text)[:300]
 
 def search_similar_texts(query, top_k=5):
-    query_vector = get_embedding(query)
+    query_vector = get_query_embedding(query)
+    key = query_cache.make_key(query_vector, top_k)
+    cached = query_cache.get(key)
+    if cached is not None:
+        return cached
+
     results = qdrant.search(
         collection_name=collection_name,
         query_vector=query_vector,
+        query_filter=NOT_SENTINEL,
         limit=top_k,
-        with_payload=True
+        with_payload=True,
+        search_params=SEARCH_PARAMS
     )
-    return [r.payload["text"] for r in results]
-
-def parse_row(text):
-    def extract(pattern):
-        match = re.search(pattern, text)
-        return float(match.group(1)) if match else None
-
-    return {
-        "TirePressure_Front": extract(r"Tire Pressure Front: ([\d.]+)"),
-        "TirePressure_Rear": extract(r"Tire Pressure Rear: ([\d.]+)"),
-        "TireSize_Front": extract(r"Tire Size Front: ([\d.]+)"),
-        "TireSize_Rear": extract(r"Tire Size Rear: ([\d.]+)"),
-        "DriverWeight_kg": extract(r"Driver Weight: ([\d.]+)"),
-        "CoolantTemperature_C": extract(r"Coolant Temperature: ([\d.]+)"),
-        "PES": extract(r"PES: ([\d.eE+-]+)")
-    }
-
-def compute_pes(row):
-    try:
-        avg_tire_size = (row["TireSize_Front"] + row["TireSize_Rear"]) / 2
-        avg_pressure = (row["TirePressure_Front"] + row["TirePressure_Rear"]) / 2
-        return (1 / (row["CoolantTemperature_C"] * row["DriverWeight_kg"] * avg_tire_size)) * (1 + avg_pressure / 30)
-    except:
-        return 0
+    payloads = [r.payload for r in results]
+    query_cache.set(key, payloads)
+    return payloads
+
+def search_similar_texts_batch(queries, top_k=5):
+    # One encode call and one search_batch RPC for every query not already cached
+    vectors = get_embedding(list(queries))
+    keys = [query_cache.make_key(vector, top_k) for vector in vectors]
+    payloads = [query_cache.get(key) for key in keys]
+    misses = [i for i, cached in enumerate(payloads) if cached is None]
+    if not misses:
+        return payloads
+
+    responses = qdrant.search_batch(
+        collection_name=collection_name,
+        requests=[
+            SearchRequest(
+                vector=vectors[i].tolist(),
+                filter=NOT_SENTINEL,
+                limit=top_k,
+                with_payload=True,
+                params=SEARCH_PARAMS
+            )
+            for i in misses
+        ]
+    )
+    for i, results in zip(misses, responses):
+        payloads[i] = [r.payload for r in results]
+        query_cache.set(keys[i], payloads[i])
+    return payloads
 
 def estimate_lap_time(pes):
     return 180 - (pes * 100000)  # basic approximation
 
+LAP_TIME_IDEAL = estimate_lap_time(0.001)
+
+# Radar chart bounds: coolant temp, driver weight, tire size, tire pressure, PES
+_MINS = np.array([80, 60, 295, 20, 0.0])
+_MAXS = np.array([100, 80, 315, 25, 0.0015])
+_RANGE = _MAXS - _MINS
+_IDEAL_NORM = (np.array([90, 70, 305, 22, 0.001]) - _MINS) / _RANGE
+
 def calculate_distance_and_speed(lap_time_sec):
     distance_km = 13.626  # Le Mans circuit length
     avg_speed_kph = (distance_km / (lap_time_sec / 3600))
     return distance_km, avg_speed_kph
 
-def suggest_adjustments(row):
-    suggestions = []
-
-    def format_range(value, min_val, max_val, label, unit, emoji):
-        if value < min_val:
-            return f"{emoji} {label} is too low ({value}{unit}). Increase to {min_val}–{max_val}{unit}."
-        elif value > max_val:
-            return f"{emoji} {label} is too high ({value}{unit}). Reduce to {min_val}–{max_val}{unit}."
-        else:
-            return f"✅ {label} is optimal at {value}{unit} (within {min_val}–{max_val}{unit})."
-
-    suggestions.append(format_range(row["CoolantTemperature_C"], 85, 95, "Coolant Temperature", "°C", "🌡️"))
-    suggestions.append(format_range(row["DriverWeight_kg"], 68, 72, "Driver Weight", "kg", "⚖️"))
-
-    front = row["TireSize_Front"]
-    rear = row["TireSize_Rear"]
-    if front != 305 or rear != 305:
-        suggestions.append(f"🚞 Use 305 mm tire size for both front and rear (currently {front}/{rear}) for optimal PES.")
-    else:
-        suggestions.append("✅ Tire sizes are optimal at 305 mm (front and rear).")
-
-    avg_pressure = (row["TirePressure_Front"] + row["TirePressure_Rear"]) / 2
-    suggestions.append(format_range(avg_pressure, 21.5, 22.5, "Average Tire Pressure", " PSI", "🔧"))
-
-    return suggestions
-
 def rag_query_pipeline(query):
     context_passages = search_similar_texts(query)
-    parsed = parse_row(context_passages[0])
-    pes = compute_pes(parsed)
-    suggestions = suggest_adjustments(parsed)
+    row = context_passages[0]["row"]
+    pes = context_passages[0]["pes"]  # scored by compute_pes_batch at ingest
+    suggestions = suggest_adjustments(row)
     lap_time = estimate_lap_time(pes)
     distance, speed = calculate_distance_and_speed(lap_time)
 
     return {
-        "context": context_passages[0],
-        "row": parsed,
+        "context": context_passages[0]["text"],
+        "row": row,
         "pes": pes,
         "lap_time": lap_time,
         "distance": distance,
@@ -139,7 +297,6 @@ def rag_query_pipeline(query):
     }
 
 # === 5. Streamlit UI ===
-st.set_page_config(page_title="PES Advisor", page_icon="🏍️")
 st.title("🏎️ LeMans PES Performance Advisor")
 
 # --- RAG Query ---
@@ -173,13 +330,13 @@ st.header("📋 Manual Input")
 with st.form("manual_form"):
     col1, col2 = st.columns(2)
     with col1:
-        tire_pressure_front = st.number_input("Tire Pressure Front (PSI)", value=22.0)
-        tire_size_front = st.number_input("Tire Size Front (mm)", value=305.0)
-        driver_weight = st.number_input("Driver Weight (kg)", value=70.0)
+        tire_pressure_front = st.number_input("Tire Pressure Front (PSI)", value=22.0, min_value=0.0)
+        tire_size_front = st.number_input("Tire Size Front (mm)", value=305.0, min_value=1.0)
+        driver_weight = st.number_input("Driver Weight (kg)", value=70.0, min_value=1.0)
     with col2:
-        tire_pressure_rear = st.number_input("Tire Pressure Rear (PSI)", value=22.0)
-        tire_size_rear = st.number_input("Tire Size Rear (mm)", value=305.0)
-        coolant_temp = st.number_input("Coolant Temperature (°C)", value=90.0)
+        tire_pressure_rear = st.number_input("Tire Pressure Rear (PSI)", value=22.0, min_value=0.0)
+        tire_size_rear = st.number_input("Tire Size Rear (mm)", value=305.0, min_value=1.0)
+        coolant_temp = st.number_input("Coolant Temperature (°C)", value=90.0, min_value=1.0)
 
     submitted = st.form_submit_button("Analyze Custom")
 
@@ -192,10 +349,9 @@ if submitted:
         "DriverWeight_kg": driver_weight,
         "CoolantTemperature_C": coolant_temp
     }
-    pes = compute_pes(row)
+    pes, suggestions = analyze(row)
     lap_time = estimate_lap_time(pes)
     distance, speed = calculate_distance_and_speed(lap_time)
-    suggestions = suggest_adjustments(row)
 
     st.subheader("📈 Estimated PES")
     st.success(f"{pes:.6f}")
@@ -216,17 +372,14 @@ if submitted:
     st.subheader("📉 Comparison Radar Chart")
     labels = ["Coolant Temp", "Driver Weight", "Tire Size", "Tire Pressure", "PES"]
     user_vals = [coolant_temp, driver_weight, (tire_size_front + tire_size_rear)/2, (tire_pressure_front + tire_pressure_rear)/2, pes]
-    ideal_vals = [90, 70, 305, 22, 0.001]
-    user_norm = [(v - minv) / (maxv - minv) for v, minv, maxv in zip(user_vals, [80, 60, 295, 20, 0], [100, 80, 315, 25, 0.0015])]
-    ideal_norm = [(v - minv) / (maxv - minv) for v, minv, maxv in zip(ideal_vals, [80, 60, 295, 20, 0], [100, 80, 315, 25, 0.0015])]
+    user_norm = (np.array(user_vals) - _MINS) / _RANGE
 
     fig = go.Figure()
     fig.add_trace(go.Scatterpolar(r=user_norm, theta=labels, fill='toself', name='User'))
-    fig.add_trace(go.Scatterpolar(r=ideal_norm, theta=labels, fill='toself', name='Ideal'))
+    fig.add_trace(go.Scatterpolar(r=_IDEAL_NORM, theta=labels, fill='toself', name='Ideal'))
     fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 1])), showlegend=True)
     st.plotly_chart(fig, use_container_width=True)
 
-    lap_time_ideal = estimate_lap_time(0.001)
-    delta = lap_time - lap_time_ideal
+    delta = lap_time - LAP_TIME_IDEAL
     st.subheader("⏱️ Lap Time Delta")
     st.info(f"Your current parameters result in +{delta:.2f} seconds slower than ideal.")
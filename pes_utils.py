@@ -1,33 +1,73 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # optional; compute_pes_batch falls back to NumPy
+    njit = None
+
+INV_30 = 1.0 / 30.0
+
+TOO_LOW_TEMPLATE = "{emoji} {label} is too low ({value}{unit}). Increase to {min_val}–{max_val}{unit}."
+TOO_HIGH_TEMPLATE = "{emoji} {label} is too high ({value}{unit}). Reduce to {min_val}–{max_val}{unit}."
+OPTIMAL_TEMPLATE = "✅ {label} is optimal at {value}{unit} (within {min_val}–{max_val}{unit})."
+
+def _pes(avg_tire_size, avg_pressure, coolant_temp, driver_weight):
+    return (1.0 + avg_pressure * INV_30) / (coolant_temp * driver_weight * avg_tire_size)
+
 def compute_pes(row):
-    try:
-        avg_tire_size = (row["TireSize_Front"] + row["TireSize_Rear"]) / 2
-        avg_pressure = (row["TirePressure_Front"] + row["TirePressure_Rear"]) / 2
-        return (1 / (row["CoolantTemperature_C"] * row["DriverWeight_kg"] * avg_tire_size)) * (1 + avg_pressure / 30)
-    except:
-        return 0
+    avg_tire_size = (row["TireSize_Front"] + row["TireSize_Rear"]) * 0.5
+    avg_pressure = (row["TirePressure_Front"] + row["TirePressure_Rear"]) * 0.5
+    return _pes(avg_tire_size, avg_pressure, row["CoolantTemperature_C"], row["DriverWeight_kg"])
 
-def suggest_adjustments(row):
-    suggestions = []
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _pes_kernel(pressure_front, pressure_rear, size_front, size_rear, coolant_temp, driver_weight):
+        out = np.empty_like(coolant_temp)
+        for i in prange(coolant_temp.shape[0]):
+            avg_tire_size = (size_front[i] + size_rear[i]) * 0.5
+            avg_pressure = (pressure_front[i] + pressure_rear[i]) * 0.5
+            out[i] = (1.0 + avg_pressure * INV_30) / (coolant_temp[i] * driver_weight[i] * avg_tire_size)
+        return out
+else:
+    def _pes_kernel(pressure_front, pressure_rear, size_front, size_rear, coolant_temp, driver_weight):
+        avg_tire_size = (size_front + size_rear) * 0.5
+        avg_pressure = (pressure_front + pressure_rear) * 0.5
+        return (1.0 + avg_pressure * INV_30) / (coolant_temp * driver_weight * avg_tire_size)
 
-    def format_range(value, min_val, max_val, label, unit, emoji):
-        if value < min_val:
-            return f"{emoji} {label} is too low ({value}{unit}). Increase to {min_val}–{max_val}{unit}."
-        elif value > max_val:
-            return f"{emoji} {label} is too high ({value}{unit}). Reduce to {min_val}–{max_val}{unit}."
-        else:
-            return f"✅ {label} is optimal at {value}{unit} (within {min_val}–{max_val}{unit})."
+def compute_pes_batch(df):
+    # Vectorised compute_pes over a frame with numeric tire sizes
+    columns = ("TirePressure_Front", "TirePressure_Rear", "TireSize_Front", "TireSize_Rear",
+               "CoolantTemperature_C", "DriverWeight_kg")
+    return _pes_kernel(*(np.ascontiguousarray(df[col].values, dtype=np.float64) for col in columns))
 
-    suggestions.append(format_range(row["CoolantTemperature_C"], 85, 95, "Coolant Temperature", "°C", "🌡️"))
-    suggestions.append(format_range(row["DriverWeight_kg"], 68, 72, "Driver Weight", "kg", "⚖️"))
+def format_range(value, min_val, max_val, label, unit, emoji):
+    if value < min_val:
+        template = TOO_LOW_TEMPLATE
+    elif value > max_val:
+        template = TOO_HIGH_TEMPLATE
+    else:
+        template = OPTIMAL_TEMPLATE
+    return template.format(value=value, min_val=min_val, max_val=max_val, label=label, unit=unit, emoji=emoji)
 
+def analyze(row):
+    # PES and suggestions in one pass, sharing the tire averages
     front = row["TireSize_Front"]
     rear = row["TireSize_Rear"]
+    coolant_temp = row["CoolantTemperature_C"]
+    driver_weight = row["DriverWeight_kg"]
+    avg_tire_size = (front + rear) * 0.5
+    avg_pressure = (row["TirePressure_Front"] + row["TirePressure_Rear"]) * 0.5
+
+    suggestions = [None] * 4
+    suggestions[0] = format_range(coolant_temp, 85, 95, "Coolant Temperature", "°C", "🌡️")
+    suggestions[1] = format_range(driver_weight, 68, 72, "Driver Weight", "kg", "⚖️")
     if front != 305 or rear != 305:
-        suggestions.append(f"🛞 Use 305 mm tire size for both front and rear (currently {front}/{rear}) for optimal PES.")
+        suggestions[2] = f"🛞 Use 305 mm tire size for both front and rear (currently {front}/{rear}) for optimal PES."
     else:
-        suggestions.append("✅ Tire sizes are optimal at 305 mm (front and rear).")
+        suggestions[2] = "✅ Tire sizes are optimal at 305 mm (front and rear)."
+    suggestions[3] = format_range(avg_pressure, 21.5, 22.5, "Average Tire Pressure", " PSI", "🔧")
 
-    avg_pressure = (row["TirePressure_Front"] + row["TirePressure_Rear"]) / 2
-    suggestions.append(format_range(avg_pressure, 21.5, 22.5, "Average Tire Pressure", " PSI", "🔧"))
+    return _pes(avg_tire_size, avg_pressure, coolant_temp, driver_weight), suggestions
 
-    return suggestions
+def suggest_adjustments(row):
+    return analyze(row)[1]
@@ -0,0 +1,46 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class QueryCache:
+    # LRU cache with a TTL for search results, keyed on the query vector.
+    # Bumping the version (after an upsert) makes every older entry unreachable.
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def make_key(self, vector, top_k):
+        digest = hashlib.sha256(np.asarray(vector, dtype=np.float32).tobytes())
+        digest.update(f"|{top_k}|{self.version}".encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()